@@ -5,26 +5,35 @@
 # - categorical logs (table -> list[str])
 
 import json
+import re
 from copy import deepcopy
+from itertools import zip_longest
 
 ESC = "\\"
 PAIR = ","
 REC = "|"
 TYPE_FILE = "coil_types.json"
 
+# ---------------- TYPE FILE ----------------
+
+try:
+    import orjson
+    def read_types():
+        with open(TYPE_FILE, "rb") as f:
+            return orjson.loads(f.read())
+except ImportError:
+    def read_types():
+        with open(TYPE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+
 # ---------------- UNESCAPE ----------------
 
+UNESC_RE = re.compile(r"\\(.)", re.DOTALL)
+
 def unesc(v: str) -> str:
-    out = []
-    i = 0
-    while i < len(v):
-        if v[i] == ESC and i + 1 < len(v):
-            out.append(v[i + 1])
-            i += 2
-        else:
-            out.append(v[i])
-            i += 1
-    return "".join(out)
+    if ESC not in v:
+        return v
+    return UNESC_RE.sub(r"\1", v)
 
 # ---------------- TYPE RESTORE ----------------
 
@@ -58,17 +67,20 @@ def decode_table(meta: str, body: str, types: dict):
             tok, val = e.split(":", 1)
             vmap[tok] = val
 
+    # resolve column types once, not per cell
+    key_types = [(k, col_types.get(k, "str")) for k in keys]
+
     rows = body.split(REC)[1:]
     records = []
+    nkeys = len(key_types)
 
     for row in rows:
-        vals = row.split(PAIR)
-        rec = {}
-        for i, k in enumerate(keys):
-            raw = vals[i] if i < len(vals) else ""
-            val = vmap.get(raw, unesc(raw))
-            rec[k] = restore_type(val, col_types.get(k, "str"))
-        records.append(rec)
+        # never split past the last column; short rows pad with ""
+        vals = row.split(PAIR, nkeys - 1)
+        records.append({
+            k: restore_type(vmap[raw] if raw in vmap else unesc(raw), t)
+            for (k, t), raw in zip_longest(key_types, vals, fillvalue="")
+        })
 
     # 🔑 LOG AUTO-FLATTEN (single-column categorical table)
     if list(col_types.keys()) == ["msg"]:
@@ -92,7 +104,6 @@ def decode_any(obj, types):
 # ---------------- ENTRY POINT ----------------
 
 def decode(payload):
-    with open(TYPE_FILE, "r", encoding="utf-8") as f:
-        types = json.load(f)
+    types = read_types()
 
     return decode_any(deepcopy(payload), types)
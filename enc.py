@@ -3,8 +3,10 @@
 # Type info stored locally (NOT sent to LLM)
 
 import json
+import re
 from collections import Counter
 from copy import deepcopy
+from itertools import chain, islice
 
 ESC = "\\"
 PAIR = ","
@@ -21,18 +23,37 @@ try:
     import tiktoken
     ENC = tiktoken.encoding_for_model("gpt-4o-mini")
     def token_count(s): return len(ENC.encode(s))
+    def _count_batch(ss): return [len(t) for t in ENC.encode_batch(ss)]
 except Exception:
     def token_count(s): return max(1, (len(s) + 3) // 4)
+    # fractional rate keeps per-cell estimates from rounding away
+    def _count_batch(ss): return [len(s) / 4 for s in ss]
+
+def token_lens(strings):
+    strings = list(strings)
+    return dict(zip(strings, _count_batch(strings)))
+
+# ---------------- TYPE FILE ----------------
+
+try:
+    import orjson
+    def write_types(types):
+        with open(TYPE_FILE, "wb") as f:
+            f.write(orjson.dumps(types, option=orjson.OPT_INDENT_2))
+except ImportError:
+    def write_types(types):
+        with open(TYPE_FILE, "w", encoding="utf-8") as f:
+            json.dump(types, f, indent=2)
 
 # ---------------- ESCAPE ----------------
 
+ESC_TABLE = str.maketrans({c: ESC + c for c in (ESC, PAIR, REC, ":")})
+ESC_CHARS = re.compile(r"[\\,|:]")
+
 def esc(v: str) -> str:
-    return (
-        v.replace(ESC, ESC + ESC)
-         .replace(PAIR, ESC + PAIR)
-         .replace(REC, ESC + REC)
-         .replace(":", ESC + ":")
-    )
+    if not ESC_CHARS.search(v):
+        return v
+    return v.translate(ESC_TABLE)
 
 # ---------------- DETECTION ----------------
 
@@ -47,74 +68,121 @@ def is_categorical_strings(arr):
         and len(set(arr)) <= len(arr) * 0.7
     )
 
+WORD_RE = re.compile(r"\w+")
+
+def iter_words(obj):
+    if isinstance(obj, dict):
+        for v in obj.values():
+            yield from iter_words(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from iter_words(v)
+    elif obj is not None:
+        yield from WORD_RE.findall(str(obj).lower())
+
+def payload_words(obj):
+    return frozenset(iter_words(obj))
+
+def word_collision(token, words):
+    return token.lower() in words
+
+def mint_tokens(words, prefix="V"):
+    # V1, V2, ... skipping any that collide with a word in the table
+    n = 0
+    while True:
+        n += 1
+        tok = f"{prefix}{n}"
+        if not word_collision(tok, words):
+            yield tok
+
 def collect_keys(records):
     keys = set()
     for r in records:
         keys.update(r.keys())
     return sorted(keys)
 
+# ---------------- BODY BUILDER ----------------
+
+def stringify(records, keys):
+    # one positional row of str cells per record, in key order
+    return [[str(r.get(k, "")) for k in keys] for r in records]
+
+def build_body(cells, keys, vmap):
+    header = f"table[{len(cells)}]{{{','.join(keys)}}}"
+    rows = (
+        PAIR.join([vmap[v] if v in vmap else esc(v) for v in row])
+        for row in cells
+    )
+    return REC.join(chain([header], rows))
+
+def vmap_meta(vmap):
+    return ";".join(f"{t}:{v}" for v, t in vmap.items())
+
 # ---------------- ITERATIVE VMAP OPTIMIZER ----------------
 
-def greedy_vmap(records, keys):
-    flat_vals = []
-    for r in records:
-        for k in keys:
-            v = r.get(k, "")
-            if v is not None:
-                flat_vals.append(str(v))
-
-    freq = Counter(flat_vals)
-    candidates = sorted(
-        [v for v, c in freq.items() if c >= 2],
-        key=lambda v: freq[v] * len(v),
-        reverse=True
+def greedy_vmap(records, keys, words):
+    # Returns (vmap, body) so the caller reuses the body rendered here
+    freq = Counter(
+        str(v)
+        for r in records
+        for v in (r.get(k, "") for k in keys)
+        if v is not None
+    )
+    candidates = [v for v, c in freq.items() if c >= 2]
+    cells = stringify(records, keys)
+    if not candidates:
+        return {}, build_body(cells, keys, {})
+
+    # Per-unit token costs, measured once. A mapping val -> tok only
+    # touches the cells holding val, so its gain is estimated from these
+    # instead of re-rendering and re-counting the whole body.
+    toks = list(islice(mint_tokens(words), len(candidates)))
+    tlen = token_lens(
+        set(toks) | set(candidates) | {esc(v) for v in candidates} | {":", ";"}
     )
+    sep = tlen[":"] + tlen[";"]
 
-    accepted = {}
-    baseline = token_count(json.dumps(records, ensure_ascii=False))
+    # Rank by tokens covered, not characters. Ascending, so that after the
+    # stable sort on estimated gain the biggest of any tie is popped first.
+    candidates.sort(key=lambda v: freq[v] * tlen[esc(v)])
 
-    while True:
-        best_gain = 0
-        best_val = None
-        best_tok = None
-
-        for val in candidates:
-            if val in accepted:
-                continue
-
-            tok = f"V{len(accepted)+1}"
-            test_map = accepted | {val: tok}
-
-            rows = []
-            for r in records:
-                row = []
-                for k in keys:
-                    v = str(r.get(k, ""))
-                    row.append(test_map.get(v, esc(v)))
-                rows.append(PAIR.join(row))
-
-            body = REC.join(
-                [f"table[{len(records)}]{{{','.join(keys)}}}"] + rows
-            )
-            meta = f"META&ORDER={','.join(keys)}&vmap=" + ";".join(
-                f"{t}:{v}" for v, t in test_map.items()
-            )
-
-            tokens = token_count(meta + "|" + body)
-            gain = baseline - tokens
-
-            if gain > best_gain:
-                best_gain = gain
-                best_val = val
-                best_tok = tok
-
-        if best_gain > 0:
-            accepted[best_val] = best_tok
-            baseline -= best_gain
-        else:
-            break
+    def est_gain(val, t):
+        # cells shrink from esc(val) to tok; the vmap grows by "tok:val;"
+        return freq[val] * (tlen[esc(val)] - t) - (t + tlen[val] + sep)
 
-    return accepted
+    accepted = {}
+    pending = candidates
+    order_t = None
+
+    while pending:
+        tok = toks[len(accepted)]
+        t = tlen[tok]
+        if t != order_t:
+            pending.sort(key=lambda v: est_gain(v, t))
+            order_t = t
+
+        val = pending.pop()
+        if est_gain(val, t) <= 0:
+            break
+        accepted[val] = tok
+
+    plain_body = build_body(cells, keys, {})
+    if not accepted:
+        return {}, plain_body
+
+    # The whole batch is verified with one full count. If the estimate was
+    # off, halve it: accepted is in gain order, so each prefix keeps the
+    # strongest mappings along with the tokens already minted for them.
+    plain = token_count(plain_body)
+    items = list(accepted.items())
+    size = len(items)
+    while size:
+        vmap = dict(items[:size])
+        body = build_body(cells, keys, vmap)
+        if token_count("vmap=" + vmap_meta(vmap) + "|" + body) < plain:
+            return vmap, body
+        size //= 2
+    return {}, plain_body
 
 # ---------------- TABLE ENCODER ----------------
 
@@ -124,27 +192,17 @@ def encode_table(records):
     tid = f"tbl_{TABLE_SEQ}"
 
     keys = collect_keys(records)
-    vmap = greedy_vmap(records, keys)
+    original_text = json.dumps(records, ensure_ascii=False)
 
-    # Build encoded body
-    rows = []
-    for r in records:
-        row = []
-        for k in keys:
-            v = str(r.get(k, ""))
-            row.append(vmap.get(v, esc(v)))
-        rows.append(PAIR.join(row))
-
-    body = REC.join(
-        [f"table[{len(records)}]{{{','.join(keys)}}}"] + rows
-    )
+    # vmap tokens must never look like a word already in the table
+    vmap, body = greedy_vmap(records, keys, payload_words(records))
 
     meta = f"META&ORDER={','.join(keys)}&tid={tid}"
     if vmap:
-        meta += "&vmap=" + ";".join(f"{t}:{v}" for v, t in vmap.items())
+        meta += "&vmap=" + vmap_meta(vmap)
 
     encoded_tokens = token_count(meta + "|" + body)
-    original_tokens = token_count(json.dumps(records, ensure_ascii=False))
+    original_tokens = token_count(original_text)
 
     if encoded_tokens >= original_tokens:
         return records  # auto-skip
@@ -187,7 +245,6 @@ def encode(payload):
 
     result = encode_any(deepcopy(payload))
 
-    with open(TYPE_FILE, "w", encoding="utf-8") as f:
-        json.dump(TYPE_REGISTRY, f, indent=2)
+    write_types(TYPE_REGISTRY)
 
     return result
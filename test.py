@@ -4,6 +4,8 @@ Enhanced token & cost analysis for multiple tokenizer models
 """
 
 import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import seaborn as sns
 import matplotlib.pyplot as plt
 from pathlib import Path
@@ -77,22 +79,53 @@ def load_text(path: Path) -> str:
 def estimate_tokens_fallback(text: str) -> int:
     return max(1, math.ceil(len(text) / 4))
 
-def tokenize_tiktoken(text, model_name):
+@lru_cache(maxsize=None)
+def encoding_for(model_name):
     if not HAVE_TIKTOKEN:
-        return estimate_tokens_fallback(text)
+        return None
     try:
-        enc = tiktoken.encoding_for_model(model_name)
+        return tiktoken.encoding_for_model(model_name)
     except Exception:
-        enc = tiktoken.get_encoding("cl100k_base")
-    return len(enc.encode(text))
+        pass
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
 
-def token_count_for_all_models(text: str):
-    results = {}
-    for model, enc_name in TOKENIZER_MODELS.items():
+def tokenize_tiktoken(texts, model_name):
+    enc = encoding_for(model_name)
+    if enc is None:
+        return [estimate_tokens_fallback(t) for t in texts]
+    batches = enc.encode_batch(texts, num_threads=os.cpu_count() or 1)
+    return [len(tokens) for tokens in batches]
+
+def token_count_for_all_models(*texts: str):
+    # Most models share an encoding, so tokenize once per encoding,
+    # with all texts in a single batched call
+    texts = list(texts)
+
+    def count(enc_name):
         try:
-            results[model] = tokenize_tiktoken(text, enc_name)
+            return tokenize_tiktoken(texts, enc_name)
         except Exception:
-            results[model] = estimate_tokens_fallback(text)
+            return [estimate_tokens_fallback(t) for t in texts]
+
+    model_keys = {}
+    enc_names = {}
+    for model, enc_name in TOKENIZER_MODELS.items():
+        enc = encoding_for(enc_name)
+        key = enc.name if enc is not None else None
+        model_keys[model] = key
+        enc_names.setdefault(key, enc_name)
+
+    # tiktoken releases the GIL while encoding, so encodings run in parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        futures = {key: ex.submit(count, name) for key, name in enc_names.items()}
+
+    results = [{} for _ in texts]
+    for model, key in model_keys.items():
+        for counts, n in zip(results, futures[key].result()):
+            counts[model] = n
     return results
 
 def write_log(message: str):
@@ -123,8 +156,7 @@ def main():
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     write_log(f"\n=== TOKEN REPORT GENERATED AT {timestamp} ===\n")
 
-    orig_counts = token_count_for_all_models(orig_text)
-    enc_counts = token_count_for_all_models(enc_text)
+    orig_counts, enc_counts = token_count_for_all_models(orig_text, enc_text)
 
     df = pd.DataFrame({
         "model": list(TOKENIZER_MODELS.keys()),
@@ -137,10 +169,12 @@ def main():
     df["difference"] = df["original"] - df["encoded"]
 
     # Cost calculation in USD and INR
-    df["orig_cost_usd"] = df.apply(lambda r: (r["original"] / 1000) * PRICE_PER_1K.get(r["model"], 0), axis=1)
-    df["enc_cost_usd"] = df.apply(lambda r: (r["encoded"] / 1000) * PRICE_PER_1K.get(r["model"], 0), axis=1)
-    df["savings_usd"] = df["orig_cost_usd"] - df["enc_cost_usd"]
-    df["savings_inr"] = df["savings_usd"] * INR_PER_USD
+    price_usd = df["model"].map(PRICE_PER_1K).fillna(0.0).to_numpy() / 1000
+    price_inr = price_usd * INR_PER_USD
+    df["orig_cost_usd"] = df["original"] * price_usd
+    df["enc_cost_usd"] = df["encoded"] * price_usd
+    df["savings_usd"] = df["difference"] * price_usd
+    df["savings_inr"] = df["difference"] * price_inr
 
     ensure_chart_dir()
     sns.set(style="whitegrid", font="Arial", font_scale=1.1)